@@ -1,5 +1,5 @@
 from django.apps import AppConfig
-from paperlessngx_mail_parser.signals import consumer_declaration
+from paperlessngx_mail_parser.signals import consumer_declaration, mail_rule_changed
 
 class MailparserConfig(AppConfig):
     name = "paperlessngx_mail_parser"
@@ -7,4 +7,9 @@ class MailparserConfig(AppConfig):
     def ready(self):
         from documents.signals import document_consumer_declaration
         document_consumer_declaration.connect(consumer_declaration)
+
+        from django.db.models.signals import post_delete, post_save
+        from paperless_mail.models import MailRule
+        post_save.connect(mail_rule_changed, sender=MailRule)
+        post_delete.connect(mail_rule_changed, sender=MailRule)
         AppConfig.ready(self)
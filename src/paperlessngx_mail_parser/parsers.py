@@ -1,5 +1,9 @@
 import subprocess
+from collections.abc import Callable
+from contextlib import ExitStack
+from concurrent.futures import Future, ThreadPoolExecutor
 from django.conf import settings
+from functools import cache
 from django.template.loader import render_to_string
 from django.utils.safestring import SafeText
 from django.utils.timezone import is_naive
@@ -18,9 +22,12 @@ from paperless_mail.parsers import MailDocumentParser as Parent
 from pathlib import Path
 from tika_client import TikaClient
 from tika_client.data_models import TikaResponse
+import base64
+import itertools
 import magic
 import re
-import uuid
+import threading
+import time
 from documents.utils import run_subprocess
 from gotenberg_client.options import Measurement, PdfAFormat
 from paperless_tesseract.signals import (
@@ -28,6 +35,110 @@ from paperless_tesseract.signals import (
     tesseract_consumer_declaration,
 )
 
+# Collapses runs of newlines into a single newline
+_DUPLICATE_NEWLINES_RE = re.compile(r"\n+")
+
+# Page css styles like {page:WordSection1;}
+_PAGE_CSS_RE = re.compile(r"\{page:.*?\}")
+
+# Escapes plain text for html and keeps its line breaks in a single pass
+_TEXT_TO_HTML = str.maketrans(
+    {"&": "&amp;", "<": "&lt;", ">": "&gt;", "\n": "<br>"}
+)
+
+# Maximum length in bytes of temporary file names derived from attachment
+# file names, leaving room for the suffix added when converting to pdf
+_MAX_FILENAME_BYTES = 200
+
+# libmagic only looks at the beginning of a file, some formats (e.g. office
+# documents without extension) need a few kilobytes to be recognised
+_MAGIC_PREFIX_BYTES = 8192
+
+# Documents converted by LibreOffice, recognised by file extension as gotenberg
+# chooses the conversion by extension anyway
+_OFFICE_MIME_TYPES = {
+    ".doc": "application/msword",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".odp": "application/vnd.oasis.opendocument.presentation",
+    ".ods": "application/vnd.oasis.opendocument.spreadsheet",
+    ".odt": "application/vnd.oasis.opendocument.text",
+    ".ppt": "application/vnd.ms-powerpoint",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".rtf": "application/rtf",
+    ".xls": "application/vnd.ms-excel",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# Converted attachments with a shorter text layer are ocred, the same threshold
+# as paperless' RasterisedDocumentParser uses (VALID_TEXT_LENGTH)
+_MIN_TEXT_LAYER_LENGTH = 50
+
+# Attachments whose text is extracted by tika instead of tesseract (as well as
+# text/* attachments)
+_TIKA_MIME_TYPES = frozenset(_OFFICE_MIME_TYPES.values())
+
+# Inline attachments smaller than this are embedded into the html as data uris
+# instead of being uploaded to gotenberg as separate files
+_MAX_DATA_URI_BYTES = 64 * 1024
+
+# Maximum number of threads writing the remaining inline attachments to disk
+_MAX_INLINE_WRITERS = 4
+
+# Page margins used for all pages rendered by gotenberg's chromium routes
+_PAGE_MARGINS = PageMarginsType(
+    top=Measurement(0.1, MeasurementUnitType.Inches),
+    bottom=Measurement(0.1, MeasurementUnitType.Inches),
+    left=Measurement(0.1, MeasurementUnitType.Inches),
+    right=Measurement(0.1, MeasurementUnitType.Inches),
+)
+
+
+def _configure_route(route):
+    """
+    Set page size, margins and scale of a gotenberg chromium route
+    """
+    return route.margins(_PAGE_MARGINS).size(A4).scale(1.0)
+
+
+def _detect_mime_type(filename: str, payload: bytes) -> str:
+    """
+    Detect the mime type of an attachment, only using libmagic if the file
+    extension isn't conclusive
+    """
+    suffix = Path(filename).suffix.lower()
+    if suffix in _OFFICE_MIME_TYPES:
+        return _OFFICE_MIME_TYPES[suffix]
+    # the pdf header must be within the first 1024 bytes
+    if suffix == ".pdf" and b"%PDF-" in payload[:1024]:
+        return "application/pdf"
+    return magic.from_buffer(payload[:_MAGIC_PREFIX_BYTES], mime=True)
+
+
+# Mail rules rarely change, but may be edited in another process (e.g. the
+# webserver) than the one consuming mails, so cached settings expire
+_MAIL_RULE_CACHE_TTL = 60.0
+_mail_rule_cache: dict[int, tuple[float, tuple[int, int]]] = {}
+
+
+def get_mail_rule_settings(mailrule_id: int) -> tuple[int, int]:
+    """
+    Get pdf layout and consumption scope of a mail rule, cached per process
+    """
+    now = time.monotonic()
+    cached = _mail_rule_cache.get(mailrule_id)
+    if cached and now - cached[0] < _MAIL_RULE_CACHE_TTL:
+        return cached[1]
+
+    rule_settings: tuple[int, int] = MailRule.objects.values_list(
+        "pdf_layout", "consumption_scope"
+    ).get(pk=mailrule_id)
+    _mail_rule_cache[mailrule_id] = (now, rule_settings)
+    return rule_settings
+
+
+def clear_mail_rule_cache() -> None:
+    _mail_rule_cache.clear()
+
 
 class MailDocumentParser(Parent):
     """
@@ -67,6 +178,14 @@ class MailDocumentParser(Parent):
     # Timeout for gotenberg in seconds. Default of 30s sometimes leads to error "503 Service Unavailable" when parsing mails
     GOTENBERG_TIMEOUT = 600.0
 
+    # Maximum number of attachments converted by gotenberg at the same time
+    GOTENBERG_CONCURRENCY = 4
+
+    # Maximum number of ocr runs at the same time. Each run already uses the
+    # threads given by PAPERLESS_THREADS_PER_WORKER, so running more of them in
+    # parallel would oversubscribe the cpu of the worker
+    OCR_CONCURRENCY = 1
+
     def parse(
         self,
         document_path: Path,
@@ -81,15 +200,35 @@ class MailDocumentParser(Parent):
         consumption_scope: MailRule.ConsumptionScope | None = None
 
         if mailrule_id:
-            rule: MailRule = MailRule.objects.get(pk=mailrule_id)
-            pdf_layout = MailRule.PdfLayout(rule.pdf_layout)
-            consumption_scope = MailRule.ConsumptionScope(rule.consumption_scope)
+            rule_pdf_layout, rule_consumption_scope = get_mail_rule_settings(
+                mailrule_id
+            )
+            pdf_layout = MailRule.PdfLayout(rule_pdf_layout)
+            consumption_scope = MailRule.ConsumptionScope(rule_consumption_scope)
         pdf_layout = pdf_layout or settings.EMAIL_PARSE_DEFAULT_LAYOUT
 
+        # numbers temporary files of this parse() call
+        file_counter = itertools.count(1)
+
         def clean_filename(filename : str) -> str:
             return filename.replace('/','_')
 
-        def get_header(parsed: MailMessage) -> list[tuple[str, str]]:
+        def cap_filename(filename: str) -> str:
+            if len(filename.encode()) <= _MAX_FILENAME_BYTES:
+                return filename
+            # keep the suffix, gotenberg chooses the conversion by file extension
+            suffix = Path(filename).suffix
+            if len(suffix.encode()) > _MAX_FILENAME_BYTES // 2:
+                suffix = ""
+            # distinct long names may share the truncated prefix
+            unique = f"-{next(file_counter)}"
+            stem = filename[: len(filename) - len(suffix)].encode()
+            stem = stem[: _MAX_FILENAME_BYTES - len(suffix.encode()) - len(unique)]
+            return stem.decode(errors="ignore") + unique + suffix
+
+        def get_header(
+            parsed: MailMessage, real_attachments: list[MailAttachment]
+        ) -> list[tuple[str, str]]:
             header: list[tuple[str, str]] = []
             header.append(
                 (
@@ -114,244 +253,313 @@ class MailDocumentParser(Parent):
 
             header.append(("Date", date.astimezone().strftime("%d.%m.%Y %H:%M")))
 
-            # Only use attachments which are not inline and not signatures
-            real_attachments: list[MailAttachment] = [
-                att
-                for att in parsed.attachments
-                if att.content_disposition == "attachment"
-                and att.content_type != "application/x-pkcs7-signature"
-            ]
-
             if real_attachments:
-                attachments: list[str] = []
-                for a in real_attachments:
-                    attachments.append(
-                        f"{clean_filename(a.filename)} ({naturalsize(a.size, binary=True, format='%.2f')})"
+                header.append(
+                    (
+                        "Attachments",
+                        ", ".join(
+                            f"{clean_filename(a.filename)} ({naturalsize(a.size, binary=True, format='%.2f')})"
+                            for a in real_attachments
+                        ),
                     )
-                header.append(("Attachments", ", ".join(attachments)))
+                )
 
             return header
 
         def strip_duplicate_newlines(text: str) -> str:
-            return re.sub(r"(\n)+", r"\n", text)
+            if "\n\n" not in text:
+                return text
+            return _DUPLICATE_NEWLINES_RE.sub("\n", text)
 
-        def get_mail_only_content(parsed: MailMessage) -> str:
+        def get_mail_only_content(
+            parsed: MailMessage, tika_client: Callable[[], TikaClient]
+        ) -> str:
             ret: str = ""
             if parsed.text:
                 ret = parsed.text
             elif parsed.html:
-                with TikaClient(tika_url=tika_url) as client:
-                    response: TikaResponse = client.tika.as_text.from_buffer(
-                        parsed.html, "text/html"
-                    )
-                    ret = response.content if response.content else ""
+                response: TikaResponse = tika_client().tika.as_text.from_buffer(
+                    parsed.html, "text/html"
+                )
+                ret = response.content if response.content else ""
             return strip_duplicate_newlines(ret)
 
         def create_txt_header(header: list[tuple[str, str]]) -> str:
-            mail_header: str = ""
-            for label, value in header:
-                mail_header += f"{label}: {value}\n"
-            return mail_header
+            return "".join(f"{label}: {value}\n" for label, value in header)
 
-        def create_html_header(header: list[tuple[str, str]]) -> str:
-            html_header: SafeText = render_to_string(
-                "header_template.html", {"header": header}
-            )
-            return html_header
+        def create_text_mail_pdf(
+            parsed: MailMessage, html_header: str, gclient: GotenbergClient
+        ) -> Path | None:
+            # no text version (e.g. html-only mail), don't render an empty page
+            if not parsed.text:
+                return None
 
-        def create_text_mail_pdf(parsed: MailMessage) -> Path:
-            text_mail_html: Path = self.tempdir / "text-mail.html"
             text_mail_pdf: Path = self.tempdir / "text-mail.pdf"
 
-            with TikaClient(tika_url=tika_url) as client:
-                txt_content_as_html = (
-                    "<tt>" + parsed.text.replace("\n", "<br>")
-                    if parsed.text
-                    else "" + "</tt>"
-                )
-            text_mail_html.write_text(
-                f"{create_html_header(get_header(parsed))}{txt_content_as_html}"
-            )
-
-            with GotenbergClient(
-                gotenberg_url, timeout=self.GOTENBERG_TIMEOUT
-            ) as client:
-                with client.chromium.html_to_pdf() as route:
-                    # Set page size, margins
-                    route.margins(
-                        PageMarginsType(
-                            top=Measurement(0.1, MeasurementUnitType.Inches),
-                            bottom=Measurement(0.1, MeasurementUnitType.Inches),
-                            left=Measurement(0.1, MeasurementUnitType.Inches),
-                            right=Measurement(0.1, MeasurementUnitType.Inches),
-                        ),
-                    ).size(A4).scale(1.0)
+            txt_content_as_html = "<tt>" + parsed.text.translate(_TEXT_TO_HTML) + "</tt>"
+            with gclient.chromium.html_to_pdf() as route:
+                _configure_route(route)
 
-                    response: SingleFileResponse = route.index(text_mail_html).run()
-                    response.to_file(text_mail_pdf)
+                # upload the page from memory, no need for a temporary file
+                response: SingleFileResponse = route.string_index(
+                    f"{html_header}{txt_content_as_html}"
+                ).run()
+                response.to_file(text_mail_pdf)
             return text_mail_pdf
 
-        def create_html_mail_pdf(parsed: MailMessage):
-            html_mail_html: Path = self.tempdir / "html-mail.html"
+        def create_html_mail_pdf(
+            parsed: MailMessage,
+            html_header: str,
+            inline_attachments: list[MailAttachment],
+            gclient: GotenbergClient,
+        ) -> Path | None:
             html_mail_pdf: Path = self.tempdir / "html-mail.pdf"
 
             if parsed.html:
                 content = parsed.html
 
-                inline_attachments: list[Path] = []
-                # include inline attachments
-                for a in [
-                    x for x in parsed.attachments if x.content_disposition == "inline"
-                ]:
-                    if a.content_id:
-                        inlineAttachment: Path = Path(self.tempdir) / a.content_id
-                        inlineAttachment.write_bytes(a.payload)
-                        inline_attachments.append(inlineAttachment)
-
-                        # replace content id references with (temporary) filename of inline attachment
-                        content = content.replace(
-                            f"cid:{a.content_id}", f"{a.content_id}"
+                # Small inline attachments are embedded into the html as data uris.
+                # Larger ones are written in parallel and uploaded as resources.
+                # Keyed by content id, the last attachment wins if several share one
+                # (and no file is written twice in parallel).
+                cid_files: dict[str, str] = {}
+                file_attachments: dict[str, MailAttachment] = {}
+                for a in inline_attachments:
+                    if len(a.payload) < _MAX_DATA_URI_BYTES:
+                        cid_files[f"cid:{a.content_id}"] = (
+                            f"data:{a.content_type};base64,"
+                            + base64.b64encode(a.payload).decode("ascii")
                         )
+                        file_attachments.pop(a.content_id, None)
+                    else:
+                        cid_files[f"cid:{a.content_id}"] = a.content_id
+                        file_attachments[a.content_id] = a
 
-                # remove page css styles in order to combine mail header and content
-                # in one page
-                content = re.sub(r"\{page:.*?\}", "", content)
-
-                html_mail_html.write_text(
-                    create_html_header(get_header(parsed)) + content if content else ""
-                )
-
-                with GotenbergClient(
-                    gotenberg_url, timeout=self.GOTENBERG_TIMEOUT
-                ) as client:
-                    with client.chromium.html_to_pdf() as route:
-                        # Set page size, margins
-                        route.margins(
-                            PageMarginsType(
-                                top=Measurement(0.1, MeasurementUnitType.Inches),
-                                bottom=Measurement(0.1, MeasurementUnitType.Inches),
-                                left=Measurement(0.1, MeasurementUnitType.Inches),
-                                right=Measurement(0.1, MeasurementUnitType.Inches),
-                            ),
-                        ).size(A4).scale(1.0)
-
-                        r = route.index(html_mail_html)
-                        if inline_attachments:
-                            for y in inline_attachments:
-                                r = r.resource(y)
-
-                        response: SingleFileResponse = r.run()
-
-                        response.to_file(html_mail_pdf)
-            return html_mail_pdf
+                inline_files: list[Path] = [
+                    Path(self.tempdir) / content_id for content_id in file_attachments
+                ]
+                if inline_files:
+                    with ThreadPoolExecutor(max_workers=_MAX_INLINE_WRITERS) as pool:
+                        # consume the results to raise errors of failed writes
+                        list(
+                            pool.map(
+                                Path.write_bytes,
+                                inline_files,
+                                [a.payload for a in file_attachments.values()],
+                            )
+                        )
 
-        def create_attachments_pdfs(parsed: MailMessage) -> list[Path]:
+                # replace content id references with data uri or (temporary) filename of
+                # inline attachment and remove page css styles in order to combine mail
+                # header and content in one page, using a single pass over the html
+                if cid_files:
+                    # longest first, so a content id doesn't shadow another one it is a prefix of
+                    cid_patterns = [
+                        re.escape(cid) for cid in sorted(cid_files, key=len, reverse=True)
+                    ]
+                    pattern = re.compile("|".join([_PAGE_CSS_RE.pattern, *cid_patterns]))
+                    content = pattern.sub(lambda m: cid_files.get(m.group(0), ""), content)
+                elif "{page:" in content:
+                    content = _PAGE_CSS_RE.sub("", content)
+
+                with gclient.chromium.html_to_pdf() as route:
+                    _configure_route(route)
+
+                    # upload the page from memory, no need for a temporary file
+                    r = route.string_index(html_header + content if content else "")
+                    if inline_files:
+                        for y in inline_files:
+                            r = r.resource(y)
+
+                    response: SingleFileResponse = r.run()
+
+                    response.to_file(html_mail_pdf)
+                return html_mail_pdf
+            return None
+
+        def create_attachments_pdfs(
+            real_attachments: list[MailAttachment],
+            gclient: GotenbergClient,
+            tika_client: Callable[[], TikaClient],
+        ) -> list[Path]:
             pdfs: list[Path] = []
 
-            # Only include attachments which are not inline - expect inline attachments without content_id - and not signatures
-            real_attachments: list[MailAttachment] = [
-                att
-                for att in parsed.attachments
-                if (
-                    att.content_disposition == "attachment"
-                    or (att.content_disposition == "inline" and not att.content_id)
-                )
-                and att.content_type != "application/x-pkcs7-signature"
-            ]
-
-            for attachment in real_attachments:
-                filename = (
-                    clean_filename(attachment.filename) if attachment.filename else str(uuid.uuid4())
-                )
-
-                path: Path = self.tempdir / f"{filename}"
-                path.write_bytes(attachment.payload)
-
-                # don't trust attachment's content type (octet-stream might be pdf)
-                mimetype = magic.from_buffer(attachment.payload, mime=True)
+            # mime types the tesseract parser can handle, the same for every attachment
+            tesseract_mime_types = frozenset(
+                tesseract_consumer_declaration(None)["mime_types"]
+            )
 
+            def extract_with_tika(
+                path: Path, mimetype: str, tclient: TikaClient
+            ) -> str | None:
+                try:
+                    tika_response: TikaResponse = tclient.tika.as_text.from_file(
+                        path, mimetype
+                    )
+                    if tika_response.content and tika_response.content.strip():
+                        return tika_response.content.strip()
+                except Exception as err:
+                    self.log.warning(
+                        f"Tika could not extract text of attachment {path.name}: {err}"
+                    )
+                return None
+
+            def process_attachment(
+                path: Path,
+                mimetype: str,
+                rasterisedDocumentParser,
+                tika_text: Future | None,
+            ) -> tuple[list[str], Path | None, bool]:
+                """
+                Extract the text of an attachment and convert it to pdf. Returns the
+                extracted texts, the pdf (if any) and whether the conversion failed.
+                """
+                texts: list[str] = []
                 original_attachment_parsed = False
-                rasterisedDocumentParser = get_tesseract_parser(self.logging_group)
-                if mimetype in tesseract_consumer_declaration(None)["mime_types"]:
-                    rasterisedDocumentParser = get_tesseract_parser(self.logging_group)
-                    rasterisedDocumentParser.parse(path, mimetype)
+                if mimetype in tesseract_mime_types:
+                    with ocr_slots:
+                        rasterisedDocumentParser.parse(path, mimetype)
                     if rasterisedDocumentParser.text:
-                        self.text += (
-                            f"\n\n= Content attachment: {filename} =\n"
-                            + rasterisedDocumentParser.text
-                        )
+                        texts.append(rasterisedDocumentParser.text)
                         original_attachment_parsed = True
 
                 if mimetype == "application/pdf":
-                    pdfs.append(path)
-                else:
-                    path_pdf: Path = self.tempdir / f"{filename}.pdf"
-                    try:
-                        with GotenbergClient(
-                            gotenberg_url, timeout=self.GOTENBERG_TIMEOUT
-                        ) as client:
-                            with client.libre_office.to_pdf() as route:
-                                response: SingleFileResponse = route.convert(path).run()
-                                response.to_file(path_pdf)
-                                pdfs.append(path_pdf)
-                        if not original_attachment_parsed:
+                    return texts, path, False
+
+                path_pdf: Path | None = None
+                try:
+                    converted_pdf: Path = path.with_name(f"{path.name}.pdf")
+                    with gclient.libre_office.to_pdf() as route:
+                        response: SingleFileResponse = route.convert(path).run()
+                        response.to_file(converted_pdf)
+                        path_pdf = converted_pdf
+                    if tika_text is not None:
+                        # tika ran while the attachment was converted, its text
+                        # replaces reading the text layer of the converted pdf
+                        text = tika_text.result()
+                        if text:
+                            texts.append(text)
+                    elif not original_attachment_parsed:
+                        # pdfs created by LibreOffice have a text layer, only use ocr
+                        # if it's (almost) empty (e.g. for documents only containing
+                        # images and maybe a caption)
+                        text = rasterisedDocumentParser.extract_text(None, path_pdf)
+                        if not text or len(text.strip()) < _MIN_TEXT_LAYER_LENGTH:
                             # assuming mime-type "application/pdf" is/remains in tesseract_consumer_declaration(None)['mime_types']
-                            rasterisedDocumentParser.parse(path_pdf, "application/pdf")
-                            if rasterisedDocumentParser.text:
-                                self.text += (
-                                    f"\n\n= Content attachment: {filename} =\n"
-                                    + rasterisedDocumentParser.text
+                            with ocr_slots:
+                                rasterisedDocumentParser.parse(
+                                    path_pdf, "application/pdf"
                                 )
-                    except:
+                            # keep the short text layer if ocr didn't find anything
+                            text = rasterisedDocumentParser.text or text
+                        if text:
+                            texts.append(text)
+                except:
+                    if tika_text is not None and (text := tika_text.result()):
+                        texts.append(text)
+                    return texts, path_pdf, True
+                return texts, path_pdf, False
+
+            # separate directory, so attachment file names can't clash with
+            # other temporary files of this parser
+            attachments_dir: Path = self.tempdir / "attachments"
+            attachments_dir.mkdir(exist_ok=True)
+
+            ocr_slots = threading.BoundedSemaphore(self.OCR_CONCURRENCY)
+
+            # Attachments are processed in parallel, each one needs a request to
+            # gotenberg and/or an ocr run. Text of office and text documents is
+            # extracted by tika in a separate pool, alongside their conversion. Parsers are
+            # created up front as they read their settings from the database, the
+            # tika client is opened here as well to share it between threads.
+            # Results are collected in attachment order.
+            with (
+                ThreadPoolExecutor(max_workers=self.GOTENBERG_CONCURRENCY) as pool,
+                ThreadPoolExecutor(max_workers=self.GOTENBERG_CONCURRENCY) as tika_pool,
+            ):
+                results: list[tuple[MailAttachment, str, Future]] = []
+                for attachment in real_attachments:
+                    filename = (
+                        clean_filename(attachment.filename)
+                        if attachment.filename
+                        else f"attachment-{next(file_counter)}"
+                    )
+
+                    # one directory per attachment, mails may contain several
+                    # attachments with the same name (and their converted pdfs
+                    # would clash as well)
+                    attachment_dir: Path = attachments_dir / str(next(file_counter))
+                    attachment_dir.mkdir()
+                    path: Path = attachment_dir / cap_filename(filename)
+                    path.write_bytes(attachment.payload)
+
+                    # don't trust attachment's content type (octet-stream might be pdf)
+                    mimetype = _detect_mime_type(filename, attachment.payload)
+
+                    # tika handles office documents and plain text, only the other
+                    # attachments may need ocr
+                    tika_text: Future | None = None
+                    rasterisedDocumentParser = None
+                    if mimetype in _TIKA_MIME_TYPES or mimetype.startswith("text/"):
+                        tika_text = tika_pool.submit(
+                            extract_with_tika, path, mimetype, tika_client()
+                        )
+                    else:
+                        rasterisedDocumentParser = get_tesseract_parser(
+                            self.logging_group
+                        )
+                    results.append(
+                        (
+                            attachment,
+                            filename,
+                            pool.submit(
+                                process_attachment,
+                                path,
+                                mimetype,
+                                rasterisedDocumentParser,
+                                tika_text,
+                            ),
+                        )
+                    )
+
+                for attachment, filename, future in results:
+                    texts, pdf, conversion_failed = future.result()
+                    for text in texts:
+                        self.text += f"\n\n= Content attachment: {filename} =\n" + text
+                    if pdf is not None:
+                        pdfs.append(pdf)
+                    if conversion_failed:
                         # if we couldn't convert the attachment to pdf
                         # create a one-side pdf with a corresponding note
                         pdfs.append(
                             create_dummy_pdf(
-                                f"The attachment (filename: <b>{attachment.filename if attachment.filename else 'unknown'}</b> content-type: <b>{attachment.content_type}</b>) could not be converted to PDF."
+                                f"The attachment (filename: <b>{attachment.filename if attachment.filename else 'unknown'}</b> content-type: <b>{attachment.content_type}</b>) could not be converted to PDF.",
+                                gclient,
                             )
                         )
             return pdfs
 
-        def merge_pdfs(pdfs) -> Path:
-            tmp_filename = str(uuid.uuid4()) + ".pdf"
-            merged_pdf: Path = self.tempdir / tmp_filename
+        def merge_pdfs(pdfs, gclient: GotenbergClient) -> Path:
+            # nothing to merge, avoid a round trip to gotenberg
+            if len(pdfs) == 1:
+                return pdfs[0]
 
-            with GotenbergClient(
-                gotenberg_url, timeout=self.GOTENBERG_TIMEOUT
-            ) as client:
-                response: SingleFileResponse = client.merge.merge().merge(pdfs).run()
-                response.to_file(merged_pdf)
+            merged_pdf: Path = self.tempdir / f"merged-{next(file_counter)}.pdf"
+
+            response: SingleFileResponse = gclient.merge.merge().merge(pdfs).run()
+            response.to_file(merged_pdf)
             return merged_pdf
 
-        def create_dummy_pdf(message: str) -> Path:
-            dummy_filename = str(uuid.uuid4())
+        def create_dummy_pdf(message: str, gclient: GotenbergClient) -> Path:
+            dummy_filename = f"dummy-{next(file_counter)}"
             pdf_path: Path = Path(self.tempdir) / f"{dummy_filename}.pdf"
 
-            with (
-                GotenbergClient(
-                    gotenberg_url, timeout=self.GOTENBERG_TIMEOUT
-                ) as client,
-                client.chromium.html_to_pdf() as route,
-            ):
+            with gclient.chromium.html_to_pdf() as route:
                 try:
-                    # Set page size, margins
-                    route.margins(
-                        PageMarginsType(
-                            top=Measurement(0.1, MeasurementUnitType.Inches),
-                            bottom=Measurement(0.1, MeasurementUnitType.Inches),
-                            left=Measurement(0.1, MeasurementUnitType.Inches),
-                            right=Measurement(0.1, MeasurementUnitType.Inches),
-                        ),
-                    ).size(A4).scale(1.0)
-
-                    index_file_path: Path = (
-                        Path(self.tempdir) / f"{dummy_filename}.html"
-                    )
+                    _configure_route(route)
 
-                    index_file_path.write_text(message)
-
-                    response: SingleFileResponse = route.index(index_file_path).run()
-                    pdf_path.write_bytes(response.content)
+                    response: SingleFileResponse = route.string_index(message).run()
+                    response.to_file(pdf_path)
 
                     return pdf_path
                 except Exception as err:
@@ -359,9 +567,8 @@ class MailDocumentParser(Parent):
                         f"Error while creating dummy PDF: {err}",
                     ) from err
 
-        message_payload: bytes = document_path.read_bytes()
-
-        parsed = MailMessage.from_bytes(message_payload)
+        # no need to keep a reference to the raw message once it is parsed
+        parsed = MailMessage.from_bytes(document_path.read_bytes())
 
         # set document created date
         if is_naive(parsed.date):
@@ -369,53 +576,117 @@ class MailDocumentParser(Parent):
         else:
             self.date = parsed.date
 
-        content = create_txt_header(get_header(parsed))
-        mail_content = get_mail_only_content(parsed)
-        self.text = content + mail_content if mail_content else ""
-
-        # finally combine different pdfs to archived file
-        pdfs_to_merge: list[Path] = []
-        text_pdf: Path
-        html_pdf: Path
-
-        if pdf_layout != MailRule.PdfLayout.HTML_ONLY:
-            text_pdf = create_text_mail_pdf(parsed)
-
-        if pdf_layout != MailRule.PdfLayout.TEXT_ONLY:
-            html_pdf = create_html_mail_pdf(parsed)
-
-        # we include either text or html mail content
-        match pdf_layout:
-            case MailRule.PdfLayout.TEXT_HTML:  # interpreted as: prefer TEXT over HTML
-                if text_pdf.exists():
-                    pdfs_to_merge.append(text_pdf)
-                elif html_pdf.exists():
-                    pdfs_to_merge.append(html_pdf)
-            case MailRule.PdfLayout.HTML_TEXT:  # interpreted as: prefer HTML over TEXT
-                if html_pdf.exists():
-                    pdfs_to_merge.append(html_pdf)
-                elif text_pdf.exists():
-                    pdfs_to_merge.append(text_pdf)
-            case MailRule.PdfLayout.HTML_ONLY:
-                if html_pdf.exists():
-                    pdfs_to_merge.append(html_pdf)
-            case MailRule.PdfLayout.TEXT_ONLY:
-                if text_pdf.exists():
-                    pdfs_to_merge.append(text_pdf)
-
-        final_pdf: Path = merge_pdfs(pdfs_to_merge)
-        if consumption_scope != MailRule.ConsumptionScope.EVERYTHING:
-            pdfs: list[Path] = create_attachments_pdfs(parsed)
-            if pdfs:
-                # If we cannot merge attachments (e.g.because they are signed) we include a note after the e-mail text
-                attachments_pdf: Path
-                try:
-                    attachments_pdf = merge_pdfs(pdfs)
-                except Exception as e:
-                    attachments_pdf = create_dummy_pdf(
-                        f"The attachments could not be converted to PDF: {e.__str__()}"
+        # Sort attachments in a single pass:
+        #   inline: inline attachments referenced by content_id from the html version
+        #   header: attachments which are not inline and not signatures
+        #   archive: header attachments and inline attachments without content_id
+        inline_attachments: list[MailAttachment] = []
+        header_attachments: list[MailAttachment] = []
+        archive_attachments: list[MailAttachment] = []
+        for att in parsed.attachments:
+            if att.content_disposition == "inline" and att.content_id:
+                inline_attachments.append(att)
+            elif att.content_type == "application/x-pkcs7-signature":
+                continue
+            elif att.content_disposition == "attachment":
+                header_attachments.append(att)
+                archive_attachments.append(att)
+            elif att.content_disposition == "inline":
+                archive_attachments.append(att)
+
+        # share one connection pool per backend for all requests of this e-mail
+        with ExitStack() as clients:
+            gclient: GotenbergClient = clients.enter_context(
+                GotenbergClient(gotenberg_url, timeout=self.GOTENBERG_TIMEOUT)
+            )
+
+            # most mails don't need tika, so only open its client on first use
+            @cache
+            def tika_client() -> TikaClient:
+                return clients.enter_context(TikaClient(tika_url=tika_url))
+
+            header: list[tuple[str, str]] = get_header(parsed, header_attachments)
+            html_header: SafeText = render_to_string(
+                "header_template.html", {"header": header}
+            )
+
+            content = create_txt_header(header)
+            mail_content = get_mail_only_content(parsed, tika_client)
+            self.text = content + mail_content if mail_content else ""
+
+            # finally combine different pdfs to archived file
+            pdfs_to_merge: list[Path] = []
+            text_pdf: Path | None = None
+            html_pdf: Path | None = None
+
+            # text and html version are rendered by gotenberg at the same time
+            text_future: Future[Path | None] | None = None
+            html_future: Future[Path | None] | None = None
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                if pdf_layout != MailRule.PdfLayout.HTML_ONLY:
+                    text_future = pool.submit(
+                        create_text_mail_pdf, parsed, html_header, gclient
+                    )
+
+                if pdf_layout != MailRule.PdfLayout.TEXT_ONLY:
+                    html_future = pool.submit(
+                        create_html_mail_pdf,
+                        parsed,
+                        html_header,
+                        inline_attachments,
+                        gclient,
+                    )
+
+                # process attachments while gotenberg is rendering the mail
+                attachment_pdfs: list[Path] = []
+                if consumption_scope != MailRule.ConsumptionScope.EVERYTHING:
+                    attachment_pdfs = create_attachments_pdfs(
+                        archive_attachments, gclient, tika_client
                     )
-                final_pdf = merge_pdfs([final_pdf, attachments_pdf])
+
+            if text_future:
+                text_pdf = text_future.result()
+
+            if html_future:
+                html_pdf = html_future.result()
+
+            # we include either text or html mail content
+            match pdf_layout:
+                case MailRule.PdfLayout.TEXT_HTML:  # interpreted as: prefer TEXT over HTML
+                    if text_pdf is not None:
+                        pdfs_to_merge.append(text_pdf)
+                    elif html_pdf is not None:
+                        pdfs_to_merge.append(html_pdf)
+                case MailRule.PdfLayout.HTML_TEXT:  # interpreted as: prefer HTML over TEXT
+                    if html_pdf is not None:
+                        pdfs_to_merge.append(html_pdf)
+                    elif text_pdf is not None:
+                        pdfs_to_merge.append(text_pdf)
+                case MailRule.PdfLayout.HTML_ONLY:
+                    if html_pdf is not None:
+                        pdfs_to_merge.append(html_pdf)
+                case MailRule.PdfLayout.TEXT_ONLY:
+                    if text_pdf is not None:
+                        pdfs_to_merge.append(text_pdf)
+
+            # the mail has no content for the chosen layout (e.g. a html-only mail
+            # and layout TEXT_ONLY), so only include the header
+            if not pdfs_to_merge:
+                pdfs_to_merge.append(create_dummy_pdf(html_header, gclient))
+
+            # merge mail and attachments in one go
+            final_pdf: Path
+            try:
+                final_pdf = merge_pdfs(pdfs_to_merge + attachment_pdfs, gclient)
+            except Exception as e:
+                if not attachment_pdfs:
+                    raise
+                # If we cannot merge attachments (e.g.because they are signed) we include a note after the e-mail text
+                attachments_pdf: Path = create_dummy_pdf(
+                    f"The attachments could not be converted to PDF: {e.__str__()}",
+                    gclient,
+                )
+                final_pdf = merge_pdfs(pdfs_to_merge + [attachments_pdf], gclient)
 
         # Convert merged document to PDF/A if requested
         # using ghostscript as there are problems converting some
@@ -427,6 +698,8 @@ class MailDocumentParser(Parent):
                     pdfa_number = 2
                 case PdfAFormat.A3b:
                     pdfa_number = 3
+                case _:
+                    pdfa_number = None
             if pdfa_number:
                 final_pdfa_version = Path(self.tempdir) / "final_pdfa.pdf"
                 cmd = [
@@ -11,3 +11,8 @@ def consumer_declaration(sender, **kwargs):
             "message/rfc822": ".eml",
         },
     }
+
+def mail_rule_changed(sender, **kwargs):
+    from paperlessngx_mail_parser.parsers import clear_mail_rule_cache
+
+    clear_mail_rule_cache()